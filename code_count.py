@@ -0,0 +1,1091 @@
+# -*- coding: utf-8 -*-
+"""
+代码行数统计库。
+
+不依赖全局状态，可在同一进程中多次使用：
+
+    from code_count import Counter
+
+    counter = Counter(minified_mode="approx")
+    for res in counter.scan(["src"]):
+        print(res["file"], res["type"], res["code"])
+"""
+
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import pathlib
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from charset_normalizer import from_bytes
+
+# =========================
+# 默认配置
+# =========================
+DEFAULT_OPTIONS = {
+    # 忽略的目录
+    "ignore_dirs": [
+        ".vs",
+        ".vscode",
+        ".idea",
+        "node_modules",
+        ".git",
+        ".github"
+    ],
+
+    # 忽略的文件
+    "ignore_files": [
+    ],
+
+    "max_file_size": 16 * 1024 * 1024, # 16MB
+
+    # 压缩/生成文件判定：存在超长行，或平均行长度过大
+    "minified_line_length": 2000,
+    "minified_avg_line_length": 200,
+    # 压缩文件处理方式：count 完整统计 / approx 近似统计 / skip 跳过
+    "minified_mode": "count",
+
+    # 单个文件处理时间预算 (秒)，None 表示不限制
+    "file_timeout": None,
+
+    # 归档模式：把 zip/tar 归档当作虚拟目录统计
+    "scan_archives": False,
+}
+
+# 默认语言注册表：(语言类别, 文件名规则, 注释配置, 字符串配置)
+DEFAULT_LANGUAGES = [
+    # C 语言
+    ("C Header", {"exts": [".h"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]}),
+    # C 头文件
+    ("C", {"exts": [".c"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]}),
+    # C++ 源文件
+    ("C++ Header", {"exts": [".hpp", ".hh", ".h++", ".hxx"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]}),
+    # C++ 头文件
+    ("C++", {"exts": [".cpp", ".cc", ".c++", ".cxx"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]}),
+    # CMake 脚本
+    ("CMake", {"exts": [".cmake"], "filenames": ["CMakeLists.txt"]}, {"single": ["#"]}, {"quotes": ["\""]}),
+    # Python 脚本
+    ("Python", {"exts": [".py"]}, {"single": ["#"]}, {"single": ["\""], "multi": [["\"\"\"", "\"\"\""], ["'''", "'''"]]}),
+    # JavaScript 文件
+    ("JavaScript", {"exts": [".js", ".mjs", ".cjs"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]}),
+    # TypeScript 文件
+    ("TypeScript", {"exts": [".ts", ".mts", ".cts"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]}),
+    # Vue 文件
+    ("Vue", {"exts": [".vue"]}, {"single": ["//"], "multi": [["/*", "*/"], ["<!--", "-->"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]}),
+    # Java 文件
+    ("Java", {"exts": [".java"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]}),
+    # HTML 文件
+    ("HTML", {"exts": [".html", ".htm"]}, {}, {"multi": [["<!--", "-->"]]}),
+    # CSS 文件
+    ("CSS", {"exts": [".css"]}, {"multi": [["/*", "*/"]]}, {}),
+    # JSON 文件
+    ("JSON", {"exts": [".json", ".jsonl"]}, {}, {"single": ["\""]}),
+    # YAML 文件
+    ("YAML", {"exts": [".yml", ".yaml"]}, {"single": ["#"]}, {}),
+    # XML 文件
+    ("XML", {"exts": [".xml"]}, {}, {"multi": [["<!--", "-->"]]}),
+    # TOML 文件
+    ("TOML", {"exts": [".toml"]}, {"single": ["#"]}, {}),
+    # Rust 文件
+    ("Rust", {"exts": [".rs"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]}),
+    # Go 文件
+    ("Go", {"exts": [".go"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]}),
+    # PHP 文件
+    ("PHP", {"exts": [".php", ".phtml", ".php4", ".php5"]}, {"single": ["//", "#"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"]}),
+    # Shell 脚本
+    ("Shell", {"exts": [".sh", ".bash", ".zsh"]}, {"single": ["#"]}, {}),
+    # bat 脚本
+    ("bat", {"exts": [".bat"]}, {"single": ["REM"]}, {"single": ["\""]}),
+    # powershell 脚本
+    ("powershell", {"exts": [".ps1"]}, {"single": ["#"]}, {"single": ["\""]}),
+    # Lua 脚本
+    ("Lua", {"exts": [".lua"]}, {"single": ["--"], "multi": [["--[[", "]]"]]}, {"single": ["\""]}),
+    # markdown 文件
+    ("markdown", {"exts": [".md", ".markdown"]}, {}, {}),
+    # Perl 脚本
+    ("Perl", {"exts": [".pl"]}, {"single": ["#"]}, {"single": ["\"", "'"]}),
+    # Assembly 文件
+    ("Assembly", {"exts": [".asm", ".s"]}, {"single": ["#", ";"]}, {"single": ["\"", "'"]}),
+]
+
+# 单文件结果中的统计指标
+METRICS = ("code", "code_char", "comment", "comment_char", "empty")
+
+# =========================
+# 高性能编码检测（已修复）
+# =========================
+def detect_encoding_fast(path):
+    with open(path, "rb") as f:
+        raw = f.read(32768)
+    return detect_encoding_bytes(raw)
+
+def detect_encoding_bytes(raw):
+    """根据文件开头的字节检测编码。"""
+    # BOM 快速判断
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return "utf-8-sig"
+    if raw.startswith(b'\xff\xfe'):
+        return "utf-16-le"
+    if raw.startswith(b'\xfe\xff'):
+        return "utf-16-be"
+
+    # UTF-8 快速路径（极快）
+    try:
+        raw.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    # charset-normalizer（高精度）
+    best = from_bytes(raw).best()
+    if best and best.encoding:
+        return best.encoding
+
+    # 兜底
+    return "latin-1"
+
+# =========================
+# 核心解析器：状态机
+# =========================
+class FileBudgetExceeded(Exception):
+    """单个文件的处理时间超出 file_timeout 预算。"""
+
+# 标记正则缓存 (标记元组 -> 交替正则)
+_MARKER_RE_CACHE = {}
+
+def _marker_re(markers):
+    """把一组标记编译为交替正则并缓存，没有标记时返回 None。"""
+    key = tuple(m for m in markers if m)
+    if not key:
+        return None
+    pattern = _MARKER_RE_CACHE.get(key)
+    if pattern is None:
+        pattern = re.compile("|".join(re.escape(m) for m in key))
+        _MARKER_RE_CACHE[key] = pattern
+    return pattern
+
+def _next_marker(pattern, line, pos, n):
+    """返回 pos 之后第一个标记的位置，找不到时返回 n。"""
+    if pattern is None:
+        return n
+    m = pattern.search(line, pos)
+    return m.start() if m else n
+
+def _count_nonspace(text):
+    """统计非空白字符数 (str.split 与 str.isspace 的空白定义一致)。"""
+    return sum(map(len, text.split()))
+
+def count_line_segments(line, comment_conf, string_conf, state, deadline=None):
+    """
+    状态机：计算一行中的代码段、注释段以及非空白字符数量。
+    deadline 为 time.monotonic() 截止时间，超时抛出 FileBudgetExceeded。
+    """
+    i = 0
+    n = len(line)
+    steps = 0
+
+    code_seg = code_chars = 0
+    comment_seg = comment_chars = 0
+
+    single_comments = comment_conf.get("single", [])
+    multi_comments = comment_conf.get("multi", [])
+    string_single = string_conf.get("single", [])
+    multi_strings = string_conf.get("multi", [])
+
+    # 各状态下可能改变状态的标记，标记之间的字符可以整段统计
+    normal_re = _marker_re(
+        [s for s, e in multi_comments] + [s for s, e in multi_strings]
+        + list(string_single) + list(single_comments)
+    )
+    comment_end_re = _marker_re([e for s, e in multi_comments])
+
+    has_code = False
+    has_comment = False
+
+    def start_code():
+        nonlocal has_code, code_seg
+        if not has_code:
+            code_seg += 1
+            has_code = True
+
+    def start_comment():
+        nonlocal has_comment, comment_seg
+        if not has_comment:
+            comment_seg += 1
+            has_comment = True
+
+    while i < n:
+        steps += 1
+        if deadline is not None and not steps & 0xFFF and time.monotonic() > deadline:
+            raise FileBudgetExceeded()
+
+        # 0. 快速路径：直接跳到下一个可能的标记位置，避免长行 (压缩文件) 逐字符匹配
+        if state["in_multi_comment"]:
+            j = _next_marker(comment_end_re, line, i, n)
+            if j > i:
+                start_comment()
+                comment_chars += _count_nonspace(line[i:j])
+                i = j
+                continue
+        elif state["in_string"]:
+            j = _next_marker(_marker_re(("\\", state["string_ender"])), line, i, n)
+            if j > i:
+                start_code()
+                code_chars += _count_nonspace(line[i:j])
+                i = j
+                continue
+        else:
+            j = _next_marker(normal_re, line, i, n)
+            if j > i:
+                nonspace = _count_nonspace(line[i:j])
+                if nonspace:
+                    start_code()
+                    code_chars += nonspace
+                i = j
+                continue
+
+        char = line[i]
+
+        # 1. 状态：在多行注释中
+        if state["in_multi_comment"]:
+            start_comment()
+            
+            if not char.isspace():
+                comment_chars += 1
+            
+            closed = False
+            for s, e in multi_comments:
+                if line.startswith(e, i):
+                    for c_char in e:
+                        if not c_char.isspace():
+                            comment_chars += 1
+                    
+                    i += len(e)
+                    state["in_multi_comment"] = False
+                    has_comment = False
+                    closed = True
+                    break
+            
+            if not closed:
+                i += 1
+            continue
+
+        # 2. 状态：在字符串中 (只统计非空白字符)
+        if state["in_string"]:
+            start_code()
+            
+            if not char.isspace():
+                code_chars += 1 
+
+            if char == "\\" and i + 1 < n:
+                if not line[i+1].isspace():
+                    code_chars += 1
+                i += 2
+                continue
+            
+            ender = state["string_ender"]
+            if line.startswith(ender, i):
+                for s_char in ender:
+                    if not s_char.isspace():
+                        code_chars += 1
+                
+                i += len(ender)
+                state["in_string"] = False
+                state["string_ender"] = None
+                continue
+            
+            i += 1
+            continue
+
+        # 3. 正常模式：检查各种开始标记
+
+        # A. 检查多行注释开始
+        is_multi_comment_start = False
+        for s, e in multi_comments:
+            if line.startswith(s, i):
+                start_comment()
+                for c_char in s:
+                    if not c_char.isspace():
+                        comment_chars += 1
+                
+                i += len(s)
+                state["in_multi_comment"] = True
+                has_code = False
+                is_multi_comment_start = True
+                break
+        if is_multi_comment_start:
+            continue
+
+        # B. 检查多行/特殊字符串开始
+        is_multi_string_start = False
+        for s, e in multi_strings:
+            if line.startswith(s, i):
+                start_code()
+                for s_char in s:
+                    if not s_char.isspace():
+                        code_chars += 1
+                
+                i += len(s)
+                state["in_string"] = True
+                state["string_ender"] = e
+                is_multi_string_start = True
+                break
+        if is_multi_string_start:
+            continue
+
+        # C. 检查普通字符串开始
+        if char in string_single:
+            start_code()
+            code_chars += 1
+            state["in_string"] = True
+            state["string_ender"] = char
+            i += 1
+            continue
+
+        # D. 检查单行注释开始
+        for s in single_comments:
+            if line.startswith(s, i):
+                start_comment()
+                
+                for c_char in s:
+                    if not c_char.isspace():
+                        comment_chars += 1
+
+                comment_chars += _count_nonspace(line[i + len(s):])
+                
+                return code_seg, code_chars, comment_seg, comment_chars
+        
+        # E. 普通代码字符
+        if not char.isspace():
+            start_code()
+            code_chars += 1
+        
+        i += 1
+
+    return code_seg, code_chars, comment_seg, comment_chars
+
+
+# =========================
+# 归档文件 (zip/tar，不解压到磁盘)
+# =========================
+ZIP_EXTS = (".zip",)
+TAR_EXTS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+def archive_kind(path):
+    """根据文件名判断归档类型，返回 "zip"、"tar" 或 None。"""
+    name = os.path.basename(path).lower()
+    if name.endswith(ZIP_EXTS):
+        return "zip"
+    if name.endswith(TAR_EXTS):
+        return "tar"
+    return None
+
+def archive_member_path(archive_path, member):
+    """归档成员的显示路径：把归档当作目录。"""
+    return os.path.join(archive_path, os.path.normpath(member))
+
+# run_tasks 中表示待处理项已取完
+_NO_TASK = object()
+
+def _add_count(counts, key, n=1):
+    counts[key] = counts.get(key, 0) + n
+
+class _ZipCache:
+    """每个工作线程各自打开的 ZipFile 句柄，使各线程可以并行随机读取成员。"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def open(self, archive_path):
+        handles = getattr(self._local, "handles", None)
+        if handles is None:
+            handles = self._local.handles = {}
+        zf = handles.get(archive_path)
+        if zf is None:
+            zf = handles[archive_path] = zipfile.ZipFile(archive_path)
+            with self._lock:
+                self._opened.append(zf)
+        return zf
+
+    def close(self):
+        with self._lock:
+            for zf in self._opened:
+                zf.close()
+            self._opened.clear()
+
+    def close_when_done(self, futures):
+        """在 futures 全部结束 (完成或取消) 后关闭句柄，不阻塞调用方。"""
+        remaining = [len(futures)]
+        if not remaining[0]:
+            self.close()
+            return
+
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.close()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+
+# =========================
+# 快照 (逐文件结果与 stat 签名)
+# =========================
+SNAPSHOT_VERSION = 1
+
+# 差异模式统计的指标
+DIFF_METRICS = ("code", "comment", "empty")
+
+def get_snapshot_root(paths):
+    """计算快照的根目录，快照中的文件以相对该目录的路径保存。"""
+    roots = []
+    for path in paths:
+        p = pathlib.Path(path.strip('"\'')).resolve()
+        roots.append(str(p) if p.is_dir() else str(p.parent))
+    if len(roots) == 1:
+        return roots[0]
+    return os.path.commonpath(roots)
+
+def file_signature(path):
+    """文件的 stat 签名 (大小, 修改时间)，用于快速判断文件是否变化。"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def file_digest(path):
+    """分块计算文件内容哈希，仅在 stat 签名无法判断时使用。"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.digest()
+
+def save_snapshot(snapshot_path, results, root):
+    """将逐文件结果 (跳过的文件除外)、stat 签名与内容哈希保存为 JSON 快照。"""
+    files = {}
+    for res in results:
+        if res.get("skipped"):
+            continue
+        try:
+            size, mtime_ns = file_signature(res["file"])
+            digest = file_digest(res["file"])
+        except OSError:
+            continue
+        rel = pathlib.Path(os.path.relpath(res["file"], root)).as_posix()
+        entry = {"type": res["type"], "size": size, "mtime_ns": mtime_ns, "digest": digest.hex()}
+        for key in METRICS:
+            entry[key] = res[key]
+        files[rel] = entry
+
+    snapshot = {"version": SNAPSHOT_VERSION, "root": root, "files": files}
+    with open(snapshot_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+def load_snapshot(snapshot_path):
+    """读取 JSON 快照，格式不符时抛出 ValueError。"""
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if (not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION
+            or not isinstance(snapshot.get("files"), dict)
+            or not all(isinstance(e, dict) and "type" in e for e in snapshot["files"].values())):
+        raise ValueError(f"invalid snapshot: {snapshot_path}")
+    return snapshot
+
+def new_delta():
+    """单个语言类别的差异统计初始值。"""
+    delta = {"added_files": 0, "removed_files": 0, "modified_files": 0}
+    for m in DIFF_METRICS:
+        delta[f"{m}_added"] = 0
+        delta[f"{m}_removed"] = 0
+    return delta
+
+def _snapshot_entry_result(rel, entry):
+    """把快照条目转换为与 Counter._count_changed 相同的 (file_type, res) 结构。"""
+    res = {"file": rel}
+    for key in METRICS:
+        res[key] = entry.get(key, 0)
+    return entry["type"], res
+
+
+# =========================
+# 统计器
+# =========================
+class Counter:
+    """
+    代码行数统计器：持有自己的语言注册表与选项，不修改任何全局状态。
+
+    单文件结果为字典：file、type、各项统计 (METRICS)、minified (是否为压缩/生成文件)，
+    以及 skipped (跳过原因："size"、"type"、"error"、"minified"、"timeout"；统计成功时为 None)。
+    """
+
+    def __init__(self, languages=None, **options):
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise TypeError(f"unknown options: {', '.join(sorted(unknown))}")
+
+        self.config = {}
+        for key, value in DEFAULT_OPTIONS.items():
+            value = options.get(key, value)
+            self.config[key] = list(value) if isinstance(value, list) else value
+
+        # 语言注册表
+        self.config["enabled_exts"] = {}
+        self.config["enabled_filenames"] = {}
+        self.config["comment_types"] = {}
+        self.config["string_types"] = {}
+        for lang in (DEFAULT_LANGUAGES if languages is None else languages):
+            self.add_config(*lang)
+
+    # 添加配置函数
+    def add_config(self, type : str, file_name : dict, comment_types : dict, string_types : dict):
+        if "exts" in file_name:
+            for ext in file_name["exts"]:
+                self.config["enabled_exts"][ext] = type
+        if "filenames" in file_name:
+            for filename in file_name["filenames"]:
+                self.config["enabled_filenames"][filename] = type
+
+        self.config["comment_types"][type] = comment_types
+
+        self.config["string_types"][type] = string_types
+
+    # =========================
+    # 单文件统计
+    # =========================
+    def get_file_type(self, file_path):
+        """根据文件名或扩展名判断语言类别，不支持时返回 None。"""
+        # 文件名+扩展名
+        file_name = os.path.basename(file_path)
+        if file_name in self.config["enabled_filenames"]:
+            return self.config["enabled_filenames"][file_name]
+        # 扩展名
+        ext = os.path.splitext(file_name)[1].lower()
+        return self.config["enabled_exts"].get(ext)
+
+    def is_minified(self, lines):
+        """根据行长度判断是否为压缩/生成文件 (如 .min.js、单行 JSON)。"""
+        if not lines:
+            return False
+        longest = max(map(len, lines))
+        if longest >= self.config["minified_line_length"]:
+            return True
+        return sum(map(len, lines)) / len(lines) >= self.config["minified_avg_line_length"]
+
+    @staticmethod
+    def _new_result(file_path, file_type, skipped=None):
+        res = {"file": file_path, "type": file_type, "skipped": skipped, "minified": False}
+        for key in METRICS:
+            res[key] = 0
+        return res
+
+    def _deadline(self):
+        if self.config["file_timeout"]:
+            return time.monotonic() + self.config["file_timeout"]
+        return None
+
+    def count_lines_approx(self, lines, file_type, file_path):
+        """压缩文件的近似统计：不运行状态机，以注释标记开头的行记为注释，其余非空行记为代码。"""
+        comment_conf = self.config["comment_types"].get(file_type, {})
+        comment_starts = tuple(comment_conf.get("single", [])) + tuple(s for s, e in comment_conf.get("multi", []))
+
+        res = self._new_result(file_path, file_type)
+
+        for line in lines:
+            stripped = line.strip()
+            if stripped == "":
+                res["empty"] += 1
+                continue
+
+            chars = _count_nonspace(stripped)
+            if comment_starts and stripped.startswith(comment_starts):
+                res["comment"] += 1
+                res["comment_char"] += chars
+            else:
+                res["code"] += 1
+                res["code_char"] += chars
+
+        return res
+
+    def count_lines(self, lines, file_type, file_path, deadline=None):
+        """用状态机统计已解码的行列表，返回单个文件的结果字典。"""
+        comment_conf = self.config["comment_types"].get(file_type, {})
+        string_conf = self.config["string_types"].get(file_type, {})
+
+        # 局部结果 (线程私有)
+        res = self._new_result(file_path, file_type)
+
+        state = {
+            "in_multi_comment": False,
+            "in_string": False,
+            "string_ender": None
+        }
+
+        for idx, line in enumerate(lines):
+            # 短行很多的文件在行间检查时间预算
+            if deadline is not None and not idx & 0x3FF and time.monotonic() > deadline:
+                raise FileBudgetExceeded()
+
+            stripped = line.strip()
+            if stripped == "":
+                res["empty"] += 1
+                continue
+
+            cs, cc, ms, mc = count_line_segments(line, comment_conf, string_conf, state, deadline)
+
+            res["code"] += cs
+            res["code_char"] += cc
+            res["comment"] += ms
+            res["comment_char"] += mc
+
+        return res
+
+    def count_file(self, file_path):
+        """统计磁盘上的单个文件，返回结果字典。"""
+        deadline = self._deadline()
+
+        # 判断文件类型
+        file_type = self.get_file_type(file_path)
+        if not file_type:
+            # 文件类型不支持，跳过
+            return self._new_result(file_path, None, "type")
+
+        # 自动检测编码
+        try:
+            # 文件大小限制
+            if os.path.getsize(file_path) > self.config["max_file_size"]:
+                return self._new_result(file_path, file_type, "size")
+            encoding = detect_encoding_fast(file_path)
+            with open(file_path, "r", encoding=encoding, errors="replace") as f:
+                lines = f.readlines()
+        except Exception:
+            return self._new_result(file_path, file_type, "error")
+
+        return self.count_decoded(lines, file_type, file_path, deadline)
+
+    def count_bytes(self, data, file_path):
+        """统计内存中的文件内容 (如归档成员)，file_path 用于判断语言类别，返回结果字典。"""
+        deadline = self._deadline()
+
+        file_type = self.get_file_type(file_path)
+        if not file_type:
+            return self._new_result(file_path, None, "type")
+
+        if len(data) > self.config["max_file_size"]:
+            return self._new_result(file_path, file_type, "size")
+
+        # 与 open() 文本模式一致的解码与换行处理
+        encoding = detect_encoding_bytes(data[:32768])
+        try:
+            with io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors="replace") as f:
+                lines = f.readlines()
+        except Exception:
+            return self._new_result(file_path, file_type, "error")
+
+        return self.count_decoded(lines, file_type, file_path, deadline)
+
+    def count_decoded(self, lines, file_type, file_path, deadline=None):
+        """统计已解码的文件内容，处理压缩文件与时间预算，返回结果字典。"""
+        # 压缩/生成文件：按配置完整统计、近似统计或跳过
+        minified = self.is_minified(lines)
+        if minified and self.config["minified_mode"] == "skip":
+            res = self._new_result(file_path, file_type, "minified")
+        elif minified and self.config["minified_mode"] == "approx":
+            res = self.count_lines_approx(lines, file_type, file_path)
+        else:
+            try:
+                res = self.count_lines(lines, file_type, file_path, deadline)
+            except FileBudgetExceeded:
+                # 超出时间预算：放弃该文件，避免拖住整个统计
+                res = self._new_result(file_path, file_type, "timeout")
+        res["minified"] = minified
+        return res
+
+    # =========================
+    # 归档文件
+    # =========================
+    def _member_allowed(self, member, skipped_dirs, counts):
+        """对归档成员路径应用 ignore_dirs/ignore_files 规则，跳过数记入 counts。
+
+        skipped_dirs 记录该归档中已跳过的目录，保证每个目录只计数一次。
+        """
+        parts = pathlib.PurePosixPath(member).parts
+        for i, part in enumerate(parts[:-1]):
+            if part in self.config["ignore_dirs"]:
+                prefix = "/".join(parts[:i + 1])
+                if prefix not in skipped_dirs:
+                    skipped_dirs.add(prefix)
+                    _add_count(counts, "skip_dir_count")
+                return False
+        if parts and parts[-1] in self.config["ignore_files"]:
+            _add_count(counts, "skip_file_count")
+            return False
+        return True
+
+    def _walk_zip(self, archive_path, counts):
+        """读取 zip 中央目录，把每个成员作为 (归档路径, 成员名) 产出。"""
+        try:
+            with zipfile.ZipFile(archive_path) as zf:
+                infos = zf.infolist()
+        except (OSError, zipfile.BadZipFile):
+            _add_count(counts, "skip_file_count")
+            return
+
+        _add_count(counts, "archive_count")
+
+        skipped_dirs = set()
+        for info in infos:
+            if info.is_dir() or not self._member_allowed(info.filename, skipped_dirs, counts):
+                continue
+            yield (archive_path, info.filename)
+
+    def count_zip_member(self, archive_path, member, zips=None):
+        """统计 zip 中的单个成员，返回结果字典；zips 为多线程共享的 _ZipCache。"""
+        file_path = archive_member_path(archive_path, member)
+        # 先按文件名和大小过滤，避免解压不统计的成员
+        file_type = self.get_file_type(file_path)
+        if not file_type:
+            return self._new_result(file_path, None, "type")
+        try:
+            if zips is not None:
+                data = self._read_zip_member(zips.open(archive_path), member)
+            else:
+                with zipfile.ZipFile(archive_path) as zf:
+                    data = self._read_zip_member(zf, member)
+        except Exception:
+            # 损坏 (zlib/bz2/lzma 解压失败)、加密或不支持的压缩方式
+            return self._new_result(file_path, file_type, "error")
+        if data is None:
+            return self._new_result(file_path, file_type, "size")
+        return self.count_bytes(data, file_path)
+
+    def _read_zip_member(self, zf, member):
+        info = zf.getinfo(member)
+        if info.file_size > self.config["max_file_size"]:
+            return None
+        return zf.read(info)
+
+    def count_tar(self, archive_path, counts):
+        """以流模式顺序读取 tar 归档，返回各成员的结果列表，跳过数与归档数记入 counts。"""
+        results = []
+        skipped_dirs = set()
+        try:
+            with tarfile.open(archive_path, "r|*") as tf:
+                _add_count(counts, "archive_count")
+                for info in tf:
+                    if not info.isfile() or not self._member_allowed(info.name, skipped_dirs, counts):
+                        continue
+                    file_path = archive_member_path(archive_path, info.name)
+                    file_type = self.get_file_type(file_path)
+                    if not file_type:
+                        results.append(self._new_result(file_path, None, "type"))
+                        continue
+                    if info.size > self.config["max_file_size"]:
+                        results.append(self._new_result(file_path, file_type, "size"))
+                        continue
+                    data = tf.extractfile(info).read()
+                    results.append(self.count_bytes(data, file_path))
+        except Exception:
+            # 损坏的归档或成员 (含 zlib/bz2/lzma 解压失败)：保留已读取成员的结果
+            _add_count(counts, "skip_file_count")
+        return results
+
+    # =========================
+    # 文件收集器 (只负责收集路径)
+    # =========================
+    def _collect_file(self, path, counts):
+        """产出文件对应的待处理项；归档模式下 zip 展开为成员，tar 作为一个流式任务。"""
+        if self.config["scan_archives"]:
+            kind = archive_kind(path)
+            if kind == "zip":
+                yield from self._walk_zip(path, counts)
+                return
+            if kind == "tar":
+                yield (path, None)
+                return
+        yield path
+
+    def _walk_dir(self, dir_path, counts):
+        """递归遍历目录，逐个产出需要处理的文件路径"""
+        try:
+            dir_path_obj = pathlib.Path(dir_path)
+
+            for item in dir_path_obj.iterdir():
+                try:
+                    if item.is_file():
+                        if item.name in self.config["ignore_files"]:
+                            _add_count(counts, "skip_file_count")
+                            continue
+                        yield from self._collect_file(str(item), counts)
+                    elif item.is_dir():
+                        if item.name in self.config["ignore_dirs"]:
+                            _add_count(counts, "skip_dir_count")
+                            continue
+                        yield from self._walk_dir(str(item), counts)
+                except (OSError, PermissionError):
+                    # 忽略无法访问的文件或目录
+                    continue
+
+        except (OSError, PermissionError):
+            # 回退到传统的 os.listdir 方法
+            try:
+                items = os.listdir(dir_path)
+            except:
+                return
+
+            for item in items:
+                try:
+                    path = os.path.join(dir_path, item)
+                    if os.path.isfile(path):
+                        yield from self._collect_file(path, counts)
+                    elif os.path.isdir(path):
+                        if item in self.config["ignore_dirs"]:
+                            _add_count(counts, "skip_dir_count")
+                            continue
+                        yield from self._walk_dir(path, counts)
+                except (OSError, PermissionError):
+                    continue
+
+    def iter_tasks(self, paths, counts=None, missing=None):
+        """
+        边遍历边产出待处理项：普通文件路径，或 (归档路径, 成员名) 元组 (tar 归档的成员名为 None)。
+        counts 接收跳过的文件/目录数与归档数，missing 接收不存在的路径。
+        """
+        if counts is None:
+            counts = {}
+        if missing is None:
+            missing = []
+        for path in paths:
+            # 清理路径字符串，移除可能的引号
+            path = path.strip('"\'')  # 移除首尾的引号
+
+            # 使用 pathlib 处理路径
+            try:
+                p = pathlib.Path(path)
+                # resolve() 会处理相对路径并规范化路径
+                resolved_path = p.resolve()
+
+                if resolved_path.exists():
+                    if resolved_path.is_file():
+                        yield from self._collect_file(str(resolved_path), counts)
+                    elif resolved_path.is_dir():
+                        yield from self._walk_dir(str(resolved_path), counts)
+                else:
+                    # 尝试不解析的路径
+                    if p.exists():
+                        if p.is_file():
+                            yield from self._collect_file(str(p), counts)
+                        elif p.is_dir():
+                            yield from self._walk_dir(str(p), counts)
+                    else:
+                        missing.append(str(resolved_path))
+            except Exception:
+                # 回退到传统方法
+                try:
+                    normalized_path = os.path.abspath(os.path.normpath(path))
+                    if os.path.exists(normalized_path):
+                        if os.path.isfile(normalized_path):
+                            yield from self._collect_file(normalized_path, counts)
+                        else:
+                            yield from self._walk_dir(normalized_path, counts)
+                    else:
+                        missing.append(normalized_path)
+                except Exception as e:
+                    missing.append(f"{path} - {str(e)}")
+
+    def collect(self, paths, counts=None, missing=None):
+        """收集全部待处理项并返回列表，参数同 iter_tasks。"""
+        return list(self.iter_tasks(paths, counts, missing))
+
+    # =========================
+    # 并行处理
+    # =========================
+    def run_task(self, task, zips=None):
+        """处理一个待处理项，返回 (单文件结果列表, 计数增量)；意外异常记为该项的 "error" 结果。"""
+        counts = {}
+        try:
+            if isinstance(task, str):
+                results = [self.count_file(task)]
+            elif task[1] is None:
+                # tar 只能顺序读取，整个归档作为一个任务流式处理
+                results = self.count_tar(task[0], counts)
+            else:
+                results = [self.count_zip_member(task[0], task[1], zips)]
+        except Exception:
+            # 单个待处理项出错不应中断整个统计，已累计的计数一并丢弃
+            if isinstance(task, str):
+                file_path = task
+            elif task[1] is None:
+                file_path = task[0]
+            else:
+                file_path = archive_member_path(task[0], task[1])
+            return [self._new_result(file_path, self.get_file_type(file_path), "error")], {}
+        return results, counts
+
+    def run_tasks(self, tasks, max_workers=None, stop_event=None):
+        """
+        用线程池并行处理待处理项，按完成顺序产出 (task, 单文件结果列表, 计数增量)。
+
+        同时在途的任务数有上限，调用方停止迭代或 stop_event 置位时尚未开始的任务不会再处理，
+        也不再等待进行中的任务。
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() * 2 if os.cpu_count() else 8
+
+        tasks = iter(tasks)
+        zips = _ZipCache()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        in_flight = {}
+
+        def submit_next():
+            task = next(tasks, _NO_TASK)
+            if task is not _NO_TASK:
+                in_flight[executor.submit(self.run_task, task, zips)] = task
+
+        # 有 stop_event 时定期醒来检查，而不是一直等到某个任务完成
+        poll = None if stop_event is None else 0.2
+
+        try:
+            for _ in range(max_workers * 2):
+                submit_next()
+            while in_flight:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = in_flight.pop(future)
+                    submit_next()
+                    results, counts = future.result()
+                    yield task, results, counts
+        finally:
+            if in_flight:
+                # 提前停止：取消排队的任务，进行中的任务结果直接丢弃
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=True)
+            # 进行中的任务结束后再关闭 zip 句柄
+            zips.close_when_done(list(in_flight))
+
+    def scan(self, paths, max_workers=None):
+        """扫描路径 (文件或目录)，按完成顺序逐个产出单文件结果字典。"""
+        for _, results, _ in self.run_tasks(self.iter_tasks(paths), max_workers):
+            yield from results
+
+    # =========================
+    # 差异模式 (只解析变化的文件)
+    # =========================
+    def _collect_tree(self, root):
+        """收集目录下的所有文件，返回 {相对路径: 绝对路径}。"""
+        # collect 返回解析后的路径，root 也需解析，否则符号链接会导致相对路径不一致
+        root = str(pathlib.Path(root).resolve())
+        file_list = self.collect([root])
+        return {pathlib.Path(os.path.relpath(p, root)).as_posix(): p for p in file_list}
+
+    def _count_changed(self, path):
+        """统计变化的文件，返回 (file_type, res)；需要跳过时返回 None。"""
+        res = self.count_file(path)
+        if res["skipped"]:
+            return None
+        return res["type"], res
+
+    def _diff_one(self, rel, old_path, old_entry, new_path):
+        """比较单个相对路径的新旧版本，返回 (old, new)；未变化时返回 None。
+
+        old/new 为 (file_type, res) 或 None（该侧不存在或不统计）。
+        """
+        try:
+            if old_entry is not None:
+                # 快照 vs 目录：stat 签名一致即视为未变化，旧结果直接取自快照
+                old = _snapshot_entry_result(rel, old_entry)
+                if new_path is None:
+                    return old, None
+                new_sig = file_signature(new_path)
+                if new_sig == (old_entry.get("size"), old_entry.get("mtime_ns")):
+                    return None
+                # 只有修改时间变化 (如重新检出) 时，再比较内容哈希
+                if (new_sig[0] == old_entry.get("size") and "digest" in old_entry
+                        and file_digest(new_path).hex() == old_entry["digest"]):
+                    return None
+                return old, self._count_changed(new_path)
+
+            if old_path is None:
+                return None, self._count_changed(new_path)
+            if new_path is None:
+                return self._count_changed(old_path), None
+
+            # 目录 vs 目录：先比较 stat 签名，大小不同必然变化，否则再比较内容哈希
+            old_sig = file_signature(old_path)
+            new_sig = file_signature(new_path)
+            if old_sig == new_sig:
+                return None
+            if old_sig[0] == new_sig[0] and file_digest(old_path) == file_digest(new_path):
+                return None
+            return self._count_changed(old_path), self._count_changed(new_path)
+        except OSError:
+            return None
+
+    def diff(self, old, new, max_workers=None):
+        """比较两个目录（或快照文件 old 与目录 new），只对变化的文件调用 count_file。
+
+        返回 (delta, unchanged_count)，delta 为 {语言类别: 新增/删除统计}；快照无效时抛出 ValueError。
+        """
+        old_entries = {}
+        old_files = {}
+        if os.path.isfile(old):
+            old_entries = load_snapshot(old)["files"]
+        else:
+            old_files = self._collect_tree(old)
+        new_files = self._collect_tree(new)
+
+        # 不统计的文件类型在比较签名或哈希之前排除，也不计入未变化文件
+        rels = {rel for rel in set(old_entries) | set(old_files) | set(new_files) if self.get_file_type(rel)}
+        tasks = [(rel, old_files.get(rel), old_entries.get(rel), new_files.get(rel)) for rel in sorted(rels)]
+
+        if max_workers is None:
+            max_workers = os.cpu_count() * 2 if os.cpu_count() else 8
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            changes = list(executor.map(lambda t: self._diff_one(*t), tasks))
+
+        delta = {}
+        unchanged = 0
+        for change in changes:
+            if change is None:
+                unchanged += 1
+                continue
+            old_res, new_res = change
+            if old_res is None and new_res is None:
+                # 两侧均为不统计的文件类型
+                continue
+
+            if old_res and new_res and old_res[0] == new_res[0]:
+                d = delta.setdefault(new_res[0], new_delta())
+                d["modified_files"] += 1
+                for m in DIFF_METRICS:
+                    diff = new_res[1][m] - old_res[1][m]
+                    if diff > 0:
+                        d[f"{m}_added"] += diff
+                    else:
+                        d[f"{m}_removed"] -= diff
+                continue
+
+            # 语言类别发生变化时，按旧类别删除 + 新类别新增处理
+            if old_res:
+                d = delta.setdefault(old_res[0], new_delta())
+                d["removed_files"] += 1
+                for m in DIFF_METRICS:
+                    d[f"{m}_removed"] += old_res[1][m]
+            if new_res:
+                d = delta.setdefault(new_res[0], new_delta())
+                d["added_files"] += 1
+                for m in DIFF_METRICS:
+                    d[f"{m}_added"] += new_res[1][m]
+
+        return delta, unchanged
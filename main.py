@@ -5,12 +5,12 @@ import sys
 import locale
 import threading 
 import time
-from concurrent.futures import ThreadPoolExecutor 
 from rich.console import Console
 from rich.table import Table
-from charset_normalizer import from_bytes
-import pathlib
 import argparse
+import json
+import signal
+from code_count import Counter, DIFF_METRICS, new_delta, get_snapshot_root, save_snapshot
 
 # =========================
 # I18N 国际化配置
@@ -30,7 +30,18 @@ i18n = {
         "t_empty": "空行",
         "t_code_char": "代码字符",
         "t_comment_char": "注释字符",
-        "t_total": "总计"
+        "t_total": "总计",
+        "diff_title": "📊 代码行数差异 (按类别)",
+        "unchanged_cnt": "未变化文件",
+        "t_files_delta": "文件 +/~/-",
+        "err_snapshot": "❌ 无效的快照文件",
+        "minified_cnt": "压缩/生成文件",
+        "timeout_files": "⏱️ 超出时间预算而跳过的文件",
+        "archive_cnt": "归档文件",
+        "interrupted": "⚠️ 统计被中断，以下为部分结果",
+        "collect_interrupted": "⚠️ 收集文件时被中断，未进行统计",
+        "checkpoint_saved": "💾 检查点已保存，使用 --resume 继续",
+        "err_checkpoint": "❌ 无效的检查点文件"
     },
     "en-us": {
         "title": "📊 LOC Statistics (By Category)",
@@ -46,7 +57,18 @@ i18n = {
         "t_empty": "Empty Lines",
         "t_code_char": "Code Chars",
         "t_comment_char": "Comment Chars",
-        "t_total": "TOTAL"
+        "t_total": "TOTAL",
+        "diff_title": "📊 LOC Diff (By Category)",
+        "unchanged_cnt": "Unchanged Files",
+        "t_files_delta": "Files +/~/-",
+        "err_snapshot": "❌ Invalid snapshot file",
+        "minified_cnt": "Minified/Generated Files",
+        "timeout_files": "⏱️ Files skipped after exceeding the time budget",
+        "archive_cnt": "Archives",
+        "interrupted": "⚠️ Interrupted, partial results below",
+        "collect_interrupted": "⚠️ Interrupted while collecting files, nothing was counted",
+        "checkpoint_saved": "💾 Checkpoint saved, continue with --resume",
+        "err_checkpoint": "❌ Invalid checkpoint file"
     }
 }
 
@@ -90,49 +112,28 @@ def _t(key):
 
 
 # =========================
-# 配置：扩展名、注释规则、字符串规则
+# 命令行状态 (统计逻辑见 code_count.Counter)
 # =========================
 config = {
-    # 忽略的目录
-    "ignore_dirs": [
-        ".vs",
-        ".vscode",
-        ".idea",
-        "node_modules",
-        ".git",
-        ".github"
-    ],
-
-    # 忽略的文件
-    "ignore_files": [
-    ],
-
-    # 允许的扩展名
-    "enabled_exts": {
-    },
-
-    # 允许的文件名+扩展名
-    "enabled_filenames": {
-    },
-
-    # 注释配置
-    "comment_types": {
-    },
-
-    # 字符串配置
-    "string_types": {
-    },
-
-    "max_file_size": 16 * 1024 * 1024, # 16MB
-    
     # 全局结果容器
     "result": {}, 
     "quick_result": {
         "file_count": 0,
         "skip_dir_count": 0,
         "skip_file_count": 0,
+        "minified_count": 0,
+        "archive_count": 0,
     },
 
+    # 超出时间预算的文件
+    "timeout_files": [],
+
+    # 已完成的待处理项，用于写入检查点
+    "done_tasks": set(),
+
+    # 检查点写入间隔 (秒)
+    "checkpoint_interval": 30,
+
     # 实时文件模式标志
     "enabled_file_mode": False,
 
@@ -140,443 +141,163 @@ config = {
     "show_progress": True,
 }
 
-# 添加配置函数
-def add_config(type : str, file_name : dict, comment_types : dict, string_types : dict):
-    if "exts" in file_name:
-        for ext in file_name["exts"]:
-            config["enabled_exts"][ext] = type
-    if "filenames" in file_name:
-        for filename in file_name["filenames"]:
-            config["enabled_filenames"][filename] = type
-            
-    config["comment_types"][type] = comment_types
-
-    config["string_types"][type] = string_types
-
-# 注册配置
-# C 语言
-add_config("C Header", {"exts": [".h"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]})
-# C 头文件
-add_config("C", {"exts": [".c"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]})
-# C++ 源文件
-add_config("C++ Header", {"exts": [".hpp", ".hh", ".h++", ".hxx"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]})
-# C++ 头文件
-add_config("C++", {"exts": [".cpp", ".cc", ".c++", ".cxx"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "\'"]})
-# CMake 脚本
-add_config("CMake", {"exts": [".cmake"], "filenames": ["CMakeLists.txt"]}, {"single": ["#"]}, {"quotes": ["\""]})
-# Python 脚本
-add_config("Python", {"exts": [".py"]}, {"single": ["#"]}, {"single": ["\""], "multi": [["\"\"\"", "\"\"\""], ["'''", "'''"]]})
-# JavaScript 文件
-add_config("JavaScript", {"exts": [".js", ".mjs", ".cjs"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]})
-# TypeScript 文件
-add_config("TypeScript", {"exts": [".ts", ".mts", ".cts"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]})
-# Vue 文件
-add_config("Vue", {"exts": [".vue"]}, {"single": ["//"], "multi": [["/*", "*/"], ["<!--", "-->"]]}, {"single": ["\"", "'"], "multi": [["`", "`"]]})
-# Java 文件
-add_config("Java", {"exts": [".java"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]})
-# HTML 文件
-add_config("HTML", {"exts": [".html", ".htm"]}, {}, {"multi": [["<!--", "-->"]]})
-# CSS 文件
-add_config("CSS", {"exts": [".css"]}, {"multi": [["/*", "*/"]]}, {})
-# JSON 文件
-add_config("JSON", {"exts": [".json", ".jsonl"]}, {}, {"single": ["\""]})
-# YAML 文件
-add_config("YAML", {"exts": [".yml", ".yaml"]}, {"single": ["#"]}, {})
-# XML 文件
-add_config("XML", {"exts": [".xml"]}, {}, {"multi": [["<!--", "-->"]]})
-# TOML 文件
-add_config("TOML", {"exts": [".toml"]}, {"single": ["#"]}, {})
-# Rust 文件
-add_config("Rust", {"exts": [".rs"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]})
-# Go 文件
-add_config("Go", {"exts": [".go"]}, {"single": ["//"], "multi": [["/*", "*/"]]}, {"single": ["\""]})
-# PHP 文件
-add_config("PHP", {"exts": [".php", ".phtml", ".php4", ".php5"]}, {"single": ["//", "#"], "multi": [["/*", "*/"]]}, {"single": ["\"", "'"]})
-# Shell 脚本
-add_config("Shell", {"exts": [".sh", ".bash", ".zsh"]}, {"single": ["#"]}, {})
-# bat 脚本
-add_config("bat", {"exts": [".bat"]}, {"single": ["REM"]}, {"single": ["\""]})
-# powershell 脚本
-add_config("powershell", {"exts": [".ps1"]}, {"single": ["#"]}, {"single": ["\""]})
-# Lua 脚本
-add_config("Lua", {"exts": [".lua"]}, {"single": ["--"], "multi": [["--[[", "]]"]]}, {"single": ["\""]})
-# markdown 文件
-add_config("markdown", {"exts": [".md", ".markdown"]}, {}, {})
-# Perl 脚本
-add_config("Perl", {"exts": [".pl"]}, {"single": ["#"]}, {"single": ["\"", "'"]})
-# Assembly 文件
-add_config("Assembly", {"exts": [".asm", ".s"]}, {"single": ["#", ";"]}, {"single": ["\"", "'"]})
-
-
-# 引入全局锁来保护 config 字典的修改
-CONFIG_LOCK = threading.Lock()
+# 引入全局锁来保护 config 字典的修改 (可重入，便于一次合并一个任务的多个结果)
+CONFIG_LOCK = threading.RLock()
+
+# 收到 SIGINT/SIGTERM 后置位，停止合并新的结果
+STOP_EVENT = threading.Event()
 
 # =========================
-# 高性能编码检测（已修复）
+# 结果合并
 # =========================
-def detect_encoding_fast(path):
-    with open(path, "rb") as f:
-        raw = f.read(32768)
-
-    # BOM 快速判断
-    if raw.startswith(b'\xef\xbb\xbf'):
-        return "utf-8-sig"
-    if raw.startswith(b'\xff\xfe'):
-        return "utf-16-le"
-    if raw.startswith(b'\xfe\xff'):
-        return "utf-16-be"
-
-    # UTF-8 快速路径（极快）
-    try:
-        raw.decode("utf-8")
-        return "utf-8"
-    except UnicodeDecodeError:
-        pass
+def finish_task(task, results, counts):
+    """合并一个已完成任务的全部结果。
 
-    # charset-normalizer（高精度）
-    best = from_bytes(raw).best()
-    if best and best.encoding:
-        return best.encoding
+    任务完成后才一次性合并结果，保证检查点中不会出现处理了一半的任务。
+    """
+    with CONFIG_LOCK:
+        for res in results:
+            record_result(res)
+        add_counts(counts)
+        config["done_tasks"].add(task)
 
-    # 兜底
-    return "latin-1"
+def add_counts(counts):
+    """把局部计数 (quick_result 的键 -> 增量) 合并到全局 config。"""
+    with CONFIG_LOCK:
+        for key, n in counts.items():
+            config["quick_result"][key] += n
 
-# =========================
-# 核心解析器：状态机
-# =========================
-def count_line_segments(line, comment_conf, string_conf, state):
-    """
-    状态机：计算一行中的代码段、注释段以及非空白字符数量。
-    """
-    i = 0
-    n = len(line)
-
-    code_seg = code_chars = 0
-    comment_seg = comment_chars = 0
-
-    single_comments = comment_conf.get("single", [])
-    multi_comments = comment_conf.get("multi", [])
-    string_single = string_conf.get("single", [])
-    multi_strings = string_conf.get("multi", [])
-
-    has_code = False
-    has_comment = False
-
-    def start_code():
-        nonlocal has_code, code_seg
-        if not has_code:
-            code_seg += 1
-            has_code = True
-
-    def start_comment():
-        nonlocal has_comment, comment_seg
-        if not has_comment:
-            comment_seg += 1
-            has_comment = True
-
-    while i < n:
-        char = line[i]
-
-        # 1. 状态：在多行注释中
-        if state["in_multi_comment"]:
-            start_comment()
-            
-            if not char.isspace():
-                comment_chars += 1
-            
-            closed = False
-            for s, e in multi_comments:
-                if line.startswith(e, i):
-                    for c_char in e:
-                        if not c_char.isspace():
-                            comment_chars += 1
-                    
-                    i += len(e)
-                    state["in_multi_comment"] = False
-                    has_comment = False
-                    closed = True
-                    break
-            
-            if not closed:
-                i += 1
-            continue
+def record_result(res):
+    """将单个文件的统计结果 (或跳过) 合并到全局 config。"""
+    with CONFIG_LOCK:
+        if res["minified"]:
+            config["quick_result"]["minified_count"] += 1
+        if res["skipped"] == "timeout":
+            config["timeout_files"].append(res["file"])
+        if res["skipped"]:
+            config["quick_result"]["skip_file_count"] += 1
+            return
 
-        # 2. 状态：在字符串中 (只统计非空白字符)
-        if state["in_string"]:
-            start_code()
-            
-            if not char.isspace():
-                code_chars += 1 
-
-            if char == "\\" and i + 1 < n:
-                if not line[i+1].isspace():
-                    code_chars += 1
-                i += 2
-                continue
-            
-            ender = state["string_ender"]
-            if line.startswith(ender, i):
-                for s_char in ender:
-                    if not s_char.isspace():
-                        code_chars += 1
-                
-                i += len(ender)
-                state["in_string"] = False
-                state["string_ender"] = None
-                continue
-            
-            i += 1
-            continue
-
-        # 3. 正常模式：检查各种开始标记
-
-        # A. 检查多行注释开始
-        is_multi_comment_start = False
-        for s, e in multi_comments:
-            if line.startswith(s, i):
-                start_comment()
-                for c_char in s:
-                    if not c_char.isspace():
-                        comment_chars += 1
-                
-                i += len(s)
-                state["in_multi_comment"] = True
-                has_code = False
-                is_multi_comment_start = True
-                break
-        if is_multi_comment_start:
-            continue
-
-        # B. 检查多行/特殊字符串开始
-        is_multi_string_start = False
-        for s, e in multi_strings:
-            if line.startswith(s, i):
-                start_code()
-                for s_char in s:
-                    if not s_char.isspace():
-                        code_chars += 1
-                
-                i += len(s)
-                state["in_string"] = True
-                state["string_ender"] = e
-                is_multi_string_start = True
-                break
-        if is_multi_string_start:
-            continue
-
-        # C. 检查普通字符串开始
-        if char in string_single:
-            start_code()
-            code_chars += 1
-            state["in_string"] = True
-            state["string_ender"] = char
-            i += 1
-            continue
-
-        # D. 检查单行注释开始
-        for s in single_comments:
-            if line.startswith(s, i):
-                start_comment()
-                
-                for c_char in s:
-                    if not c_char.isspace():
-                        comment_chars += 1
-
-                rest_of_line = line[i + len(s):].rstrip()
-                for c_char in rest_of_line:
-                    if not c_char.isspace():
-                        comment_chars += 1
-                
-                return code_seg, code_chars, comment_seg, comment_chars
-        
-        # E. 普通代码字符
-        if not char.isspace():
-            start_code()
-            code_chars += 1
-        
-        i += 1
+    file_type = res["type"]
 
-    return code_seg, code_chars, comment_seg, comment_chars
+    # --- 线程安全区域：将局部结果合并到全局 config ---
+    with CONFIG_LOCK:
+        config["quick_result"]["file_count"] += 1
+        config["result"].setdefault(file_type, []).append(res)
+          # 如果启用了文件模式，立即输出文件详细信息
+    if config["enabled_file_mode"]:
+        print(f"{_t("path")}: {res['file']} \t{_t("t_type")}: {file_type} \t{"t_code"}: {res['code']} \t"
+              f"{_t("t_comment")}: {res['comment']} \t{_t("t_empty")}: {res['empty']} \t"
+              f"{_t("t_code_char")}: {res['code_char']} \t{_t("t_comment_char")}: {res['comment_char']}")
+    # --------------------------------------------------
 
 
 # =========================
-# 文件处理 (为多线程修改)
+# 差异模式输出
 # =========================
-def handle_file(file_path):
-    """处理单个文件，并将结果安全地存储到全局配置中。"""
-    # 扩展名
-    ext = os.path.splitext(file_path)[1].lower()
-    # 文件名+扩展名
-    file_name = os.path.basename(file_path)
-
-    # 文件大小限制
-    if os.path.getsize(file_path) > config["max_file_size"]:
-        with CONFIG_LOCK:
-            config["quick_result"]["skip_file_count"] += 1
-        return
+def print_diff_report(old, new, delta, unchanged):
+    """以表格形式输出差异统计。"""
+    print(f"\n{_t('diff_title')}")
+    print(f"{_t('path')}: {old} -> {new}")
+    print(f"{_t('unchanged_cnt')}: {unchanged}")
 
-    # 判断文件类型
-    file_type = None
-    if file_name in config["enabled_filenames"]:
-        file_type = config["enabled_filenames"][file_name]
-    elif ext in config["enabled_exts"]:
-        file_type = config["enabled_exts"][ext]
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column(_t("t_type"), justify="left", style="bold yellow")
+    table.add_column(_t("t_files_delta"), justify="right")
+    for m in DIFF_METRICS:
+        table.add_column(f"{_t('t_' + m)} +", justify="right", style="green")
+        table.add_column(f"{_t('t_' + m)} -", justify="right", style="red")
 
-    if not file_type:
-        # 文件类型不支持，跳过
-        with CONFIG_LOCK:
-            config["quick_result"]["skip_file_count"] += 1
-        return
+    grand_total = new_delta()
+    for d in delta.values():
+        for key in grand_total:
+            grand_total[key] += d[key]
 
-    comment_conf = config["comment_types"].get(file_type, {})
-    string_conf = config["string_types"].get(file_type, {})
+    def files_cell(d):
+        return f"+{d['added_files']} ~{d['modified_files']} -{d['removed_files']}"
 
-    lines = None
+    # 按代码行变化量降序排序
+    rows = sorted(delta.items(), key=lambda x: x[1]["code_added"] + x[1]["code_removed"], reverse=True)
+    for ftype, d in rows:
+        cells = [ftype, files_cell(d)]
+        for m in DIFF_METRICS:
+            cells.append(f"{d[m + '_added']:,}")
+            cells.append(f"{d[m + '_removed']:,}")
+        table.add_row(*cells)
 
-    # 自动检测编码
-    try:
-        encoding = detect_encoding_fast(file_path)
-        with open(file_path, "r", encoding=encoding, errors="replace") as f:
-            lines = f.readlines()
-    except Exception:
-        with CONFIG_LOCK:
-            config["quick_result"]["skip_file_count"] += 1
-        return
-                
-    if lines is None:
-        with CONFIG_LOCK:
-            config["quick_result"]["skip_file_count"] += 1
-        return
+    cells = [f"[bold]{_t('t_total')}[/bold]", f"[bold]{files_cell(grand_total)}[/bold]"]
+    for m in DIFF_METRICS:
+        cells.append(f"[bold]{grand_total[m + '_added']:,}[/bold]")
+        cells.append(f"[bold]{grand_total[m + '_removed']:,}[/bold]")
+    table.add_row(*cells)
 
-    # 局部结果 (线程私有)
-    res = {
-        "file": file_path,
-        "code": 0, "code_char": 0,
-        "comment": 0, "comment_char": 0,
-        "empty": 0,
-    }
+    Console().print(table)
 
-    state = {
-        "in_multi_comment": False,
-        "in_string": False,
-        "string_ender": None
+
+# =========================
+# 检查点与恢复
+# =========================
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(checkpoint_path, paths, all_files):
+    """把已完成任务的结果与剩余待处理项写入检查点 (先写临时文件再替换)。"""
+    with CONFIG_LOCK:
+        done = set(config["done_tasks"])
+        result = {ftype: list(lst) for ftype, lst in config["result"].items()}
+        quick_result = dict(config["quick_result"])
+        timeout_files = list(config["timeout_files"])
+
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "paths": paths,
+        "pending": [t for t in all_files if t not in done],
+        "result": result,
+        "quick_result": quick_result,
+        "timeout_files": timeout_files,
     }
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
 
-    for line in lines:
-        stripped = line.strip()
-        if stripped == "":
-            res["empty"] += 1
-            continue
+def load_checkpoint(checkpoint_path):
+    """读取检查点并恢复已完成的结果，返回 (paths, 剩余待处理项)。
 
-        cs, cc, ms, mc = count_line_segments(line, comment_conf, string_conf, state)
-        
-        res["code"] += cs
-        res["code_char"] += cc
-        res["comment"] += ms
-        res["comment_char"] += mc
+    格式不符时抛出 ValueError 或 KeyError，此时不会修改 config。
+    """
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if not isinstance(checkpoint, dict) or checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"invalid checkpoint: {checkpoint_path}")
+
+    paths = checkpoint["paths"]
+    result = checkpoint["result"]
+    quick_result = checkpoint["quick_result"]
+    timeout_files = checkpoint["timeout_files"]
+    if not (isinstance(paths, list) and isinstance(result, dict) and isinstance(quick_result, dict)
+            and isinstance(timeout_files, list) and isinstance(checkpoint["pending"], list)):
+        raise ValueError(f"invalid checkpoint: {checkpoint_path}")
+
+    # JSON 中的归档任务为列表，还原为元组
+    pending = [t if isinstance(t, str) else tuple(t) for t in checkpoint["pending"]]
 
-    # --- 线程安全区域：将局部结果合并到全局 config ---
     with CONFIG_LOCK:
-        config["quick_result"]["file_count"] += 1
-        config["result"].setdefault(file_type, []).append(res)
-          # 如果启用了文件模式，立即输出文件详细信息
-    if config["enabled_file_mode"]:
-        print(f"{_t("path")}: {res['file']} \t{_t("t_type")}: {file_type} \t{"t_code"}: {res['code']} \t"
-              f"{_t("t_comment")}: {res['comment']} \t{_t("t_empty")}: {res['empty']} \t"
-              f"{_t("t_code_char")}: {res['code_char']} \t{_t("t_comment_char")}: {res['comment_char']}")
-    # --------------------------------------------------
+        config["result"] = result
+        config["quick_result"].update(quick_result)
+        config["timeout_files"] = timeout_files
 
+    return paths, pending
 
-# =========================
-# 文件收集器 (只负责收集路径)
-# =========================
-def walk_dir(dir_path, file_list):
-    """递归遍历目录并收集所有需要处理的文件路径"""
-    try:
-        dir_path_obj = pathlib.Path(dir_path)
-        
-        for item in dir_path_obj.iterdir():
-            try:
-                if item.is_file():
-                    if item.name in config["ignore_files"]:
-                        with CONFIG_LOCK:
-                            config["quick_result"]["skip_file_count"] += 1
-                        continue
-                    file_list.append(str(item))
-                elif item.is_dir():
-                    if item.name in config["ignore_dirs"]:
-                        with CONFIG_LOCK:
-                            config["quick_result"]["skip_dir_count"] += 1
-                        continue
-                    walk_dir(str(item), file_list)
-            except (OSError, PermissionError):
-                # 忽略无法访问的文件或目录
-                continue
-                
-    except (OSError, PermissionError):
-        # 回退到传统的 os.listdir 方法
-        try:
-            items = os.listdir(dir_path)
-        except:
-            return
+def checkpoint_writer(checkpoint_path, paths, all_files, stop_event):
+    """定期写入检查点的独立线程函数"""
+    while not stop_event.wait(config["checkpoint_interval"]):
+        save_checkpoint(checkpoint_path, paths, all_files)
 
-        for item in items:
-            try:
-                path = os.path.join(dir_path, item)
-                if os.path.isfile(path):
-                    file_list.append(path)
-                elif os.path.isdir(path):
-                    if item in config["ignore_dirs"]:
-                        with CONFIG_LOCK:
-                            config["quick_result"]["skip_dir_count"] += 1
-                        continue
-                    walk_dir(path, file_list)
-            except (OSError, PermissionError):
-                continue
-
-def get_all_files_to_process(paths):
-    """根据命令行参数获取所有待处理的文件路径"""
-    file_list = []
-    for path in paths:
-        # 清理路径字符串，移除可能的引号
-        path = path.strip('"\'')  # 移除首尾的引号
-        
-        # 使用 pathlib 处理路径
-        try:
-            import pathlib
-            p = pathlib.Path(path)
-            # resolve() 会处理相对路径并规范化路径
-            resolved_path = p.resolve()
-            
-            if resolved_path.exists():
-                if resolved_path.is_file():
-                    file_list.append(str(resolved_path))
-                elif resolved_path.is_dir():
-                    walk_dir(str(resolved_path), file_list)
-            else:
-                # 尝试不解析的路径
-                if p.exists():
-                    if p.is_file():
-                        file_list.append(str(p))
-                    elif p.is_dir():
-                        walk_dir(str(p), file_list)
-                else:
-                    print(f"{_t('err_path')}: {resolved_path}")
-        except Exception:
-            # 回退到传统方法
-            try:
-                normalized_path = os.path.abspath(os.path.normpath(path))
-                if os.path.exists(normalized_path):
-                    if os.path.isfile(normalized_path):
-                        file_list.append(normalized_path)
-                    else:
-                        walk_dir(normalized_path, file_list)
-                else:
-                    print(f"{_t('err_path')}: {normalized_path}")
-            except Exception as e:
-                print(f"{_t('err_path')}: {path} - {str(e)}")
-                
-    return file_list
+def request_stop(signum, frame):
+    """SIGINT/SIGTERM 处理函数：第一次请求停止并保存检查点，再次收到时中断当前操作。"""
+    if STOP_EVENT.is_set():
+        raise KeyboardInterrupt
+    STOP_EVENT.set()
 
 
 # =========================
@@ -599,7 +320,8 @@ def progress_displayer(total_files, stop_event):
             
             # 计算进度百分比
             if total_files > 0:
-                percent = processed_count / total_files
+                # tar 成员数在读取前未知，进度可能超过待处理项数
+                percent = min(processed_count / total_files, 1.0)
             else:
                 percent = 1.0 # 如果没有文件则视为完成
 
@@ -630,8 +352,38 @@ def main():
     parser = argparse.ArgumentParser(description='代码行数统计工具')
     parser.add_argument('paths', nargs='*', help='要统计的路径')
     parser.add_argument('-f', '--file-mode', action='store_true', help='启用文件模式，处理完每个文件后立即输出详细信息')
+    parser.add_argument('--save', metavar='FILE', help='将逐文件统计结果保存为快照，供 --diff 使用')
+    parser.add_argument('--minified', choices=['count', 'approx', 'skip'], default='count', help='压缩/生成文件的处理方式：完整统计、近似统计或跳过')
+    parser.add_argument('--file-timeout', type=float, metavar='SECONDS', help='单个文件的处理时间预算，超时的文件会被跳过并列出')
+    parser.add_argument('--archives', action='store_true', help='归档模式：不解压直接统计 zip/tar 归档中的文件')
+    parser.add_argument('--checkpoint', metavar='FILE', help='定期将已完成的结果和待处理列表写入检查点文件')
+    parser.add_argument('--resume', action='store_true', help='从 --checkpoint 指定的检查点继续统计')
+    parser.add_argument('--diff', nargs=2, metavar=('A', 'B'), help='差异模式：比较两个目录（或快照 A 与目录 B），只解析变化的文件')
     
     args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+
+    counter = Counter(
+        minified_mode=args.minified,
+        file_timeout=args.file_timeout,
+        scan_archives=args.archives and not args.diff,
+    )
+
+    # 差异模式：只解析变化的文件并输出按类别的增删统计
+    if args.diff:
+        old, new = (p.strip('"\'') for p in args.diff)
+        for p in (old, new):
+            if not os.path.exists(p):
+                print(f"{_t('err_path')}: {p}")
+                return
+        try:
+            delta, unchanged = counter.diff(old, new)
+        except ValueError:
+            print(f"{_t('err_snapshot')}: {old}")
+            return
+        print_diff_report(old, new, delta, unchanged)
+        return
     
     # 设置文件模式标志和进度条显示标志
     with CONFIG_LOCK:
@@ -639,14 +391,41 @@ def main():
         # 当启用文件模式时，禁用进度条显示以避免输出冲突
         config["show_progress"] = not args.file_mode
     
-    if not args.paths:
-        paths = [os.getcwd()]
+    # SIGINT/SIGTERM：停止收集或派发新任务，保存检查点后输出部分结果
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    # 1. 收集所有文件路径 (恢复时直接使用检查点中的剩余待处理项)
+    if args.resume:
+        try:
+            paths, all_files = load_checkpoint(args.checkpoint)
+        except (OSError, ValueError, KeyError):
+            print(f"{_t('err_checkpoint')}: {args.checkpoint}")
+            return
+        total_files = len(all_files) + config["quick_result"]["file_count"] + config["quick_result"]["skip_file_count"]
     else:
-        paths = args.paths
-    
-    # 1. 收集所有文件路径
-    all_files = get_all_files_to_process(paths)
-    total_files = len(all_files)
+        if not args.paths:
+            paths = [os.getcwd()]
+        else:
+            paths = args.paths
+        counts = {}
+        missing = []
+        all_files = []
+        try:
+            for task in counter.iter_tasks(paths, counts, missing):
+                if STOP_EVENT.is_set():
+                    break
+                all_files.append(task)
+        except KeyboardInterrupt:
+            STOP_EVENT.set()
+        if STOP_EVENT.is_set():
+            # 待处理列表不完整，无法写入可恢复的检查点
+            print(f"\n{_t('collect_interrupted')}")
+            sys.exit(130)
+        for path in missing:
+            print(f"{_t('err_path')}: {path}")
+        add_counts(counts)
+        total_files = len(all_files)
     
     console = Console()
 
@@ -663,26 +442,58 @@ def main():
         )
         progress_thread.start()
 
-    # 3. 使用线程池并行处理文件
-    max_workers = os.cpu_count() * 2 if os.cpu_count() else 8
-    
+    # 定期写入检查点
+    checkpoint_thread = None
+    stop_checkpoint_event = threading.Event()
+    if args.checkpoint:
+        checkpoint_thread = threading.Thread(
+            target=checkpoint_writer,
+            args=(args.checkpoint, paths, all_files, stop_checkpoint_event),
+            daemon=True
+        )
+        checkpoint_thread.start()
+
+    # 3. 使用线程池并行处理文件，按完成顺序合并结果
     # 使用 try...finally 确保在任何情况下都会停止进度显示线程
+    # 收到中断信号后 run_tasks 在 0.2 秒内返回，未完成的任务保留为待处理项，供 --resume 继续
+    completed = False
     try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            executor.map(handle_file, all_files)
+        for task, results, counts in counter.run_tasks(all_files, stop_event=STOP_EVENT):
+            finish_task(task, results, counts)
+        completed = not STOP_EVENT.is_set()
+    except KeyboardInterrupt:
+        # 再次收到中断信号：同样保存检查点并输出部分结果
+        STOP_EVENT.set()
     finally:
         # 4. 停止进度显示线程并等待它完成（仅在启动了进度线程时）
         if progress_thread is not None and stop_display_event is not None:
             stop_display_event.set()
             progress_thread.join()
+        if checkpoint_thread is not None:
+            stop_checkpoint_event.set()
+            checkpoint_thread.join()
+        # 未完成 (中断或异常) 时写入最终检查点
+        if args.checkpoint and not completed:
+            save_checkpoint(args.checkpoint, paths, all_files)
+
+    # 正常完成后检查点不再需要
+    interrupted = not completed
+    if args.checkpoint and completed and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
     
     # 5. 结果汇总和展示
     
     # 打印概览
+    if interrupted:
+        print(f"\n{_t('interrupted')}")
     print(f"\n{_t('title')}")
     print(f"{_t('file_cnt')}: {config['quick_result']['file_count']}")
     print(f"{_t('skip_cnt')}: {config['quick_result']['skip_file_count']}")
     print(f"{_t('skip_dir')}: {config['quick_result']['skip_dir_count']}")
+    if config["quick_result"]["archive_count"]:
+        print(f"{_t('archive_cnt')}: {config['quick_result']['archive_count']}")
+    if config["quick_result"]["minified_count"]:
+        print(f"{_t('minified_cnt')}: {config['quick_result']['minified_count']}")
 
     # 创建表格
     table = Table(show_header=True, header_style="bold cyan")
@@ -756,6 +567,25 @@ def main():
 
     # 打印表格
     console.print(table)
+
+    # 列出超出时间预算的文件
+    if config["timeout_files"]:
+        print(f"\n{_t('timeout_files')}:")
+        for path in sorted(config["timeout_files"]):
+            print(f"  {path}")
+
+    if interrupted and args.checkpoint:
+        print(f"\n{_t('checkpoint_saved')}: {args.checkpoint}")
+
+    # 保存快照 (中断时结果不完整，不保存)
+    if args.save and not interrupted:
+        results = [res for lst in config["result"].values() for res in lst]
+        save_snapshot(args.save, results, get_snapshot_root(paths))
+
+    if interrupted:
+        # 进行中的任务结果已丢弃，不再等待工作线程处理完当前文件
+        sys.stdout.flush()
+        os._exit(130)
     
 if __name__ == "__main__":
     try: